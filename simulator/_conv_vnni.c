@@ -0,0 +1,163 @@
+/*
+ * int8 * int8 -> int32 矩阵乘的 AVX-512 VNNI 实现，通过 ctypes 由 sim.py 调用
+ * 卷积经 im2col 展开后即为该矩阵乘：C (M, N) = A (M, K) * B (K, N)，A为patch矩阵，B为权重矩阵
+ *
+ * 编译（在 simulator 目录下）:
+ *     gcc -O3 -mavx512f -mavx512bw -mavx512vnni -fopenmp -shared -fPIC -o _conv_vnni.so _conv_vnni.c
+ *
+ * VPDPBUSD 计算 u8 * s8 的4元点积并累加到int32。A为有符号int8，按字节异或0x80转为 u8 = a + 128，
+ * 于是 sum((a + 128) * b) = sum(a * b) + 128 * sum(b)，每列减去预先算好的 128 * sum(B[:, n]) 即得精确结果。
+ * B（权重）由 pack_b_vnni 预先打包一次并与补偿量一起缓存，gemm_s8s8s32_vnni 只做计算。
+ * 未启用 VNNI 编译或CPU不支持时 vnni_supported() 返回0，sim.py 不会调用打包和矩阵乘函数。
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#ifdef __AVX512VNNI__
+#include <immintrin.h>
+#endif
+
+int vnni_supported(void)
+{
+#if defined(__AVX512VNNI__) && defined(__AVX512BW__)
+    __builtin_cpu_init();
+    return __builtin_cpu_supports("avx512vnni") && __builtin_cpu_supports("avx512bw");
+#else
+    return 0;
+#endif
+}
+
+#ifdef __AVX512VNNI__
+
+/* 微内核一次计算 MR 行 x (NB*16) 列，MR*NB 个zmm累加器，每个B向量被MR行复用，每个A广播被NB个向量复用 */
+#define MR 4
+#define NB_MAX 4
+
+/*
+ * 将B (K, N) 打包为 [K4][N16][4] 布局：每个zmm一次取出16列、每列连续4个k的字节；
+ * K、N不足4、16的倍数时补0。同时计算每列的补偿量 comp[n] = 128 * sum(B[:, n])
+ *
+ * b:      int8 (K, N)，C连续
+ * packed: 至少 ((K+3)/4) * N16 * 4 字节，N16 = (N+15)/16*16
+ * comp:   至少 N16 个int32
+ */
+void pack_b_vnni(const int8_t *b, int8_t *packed, int32_t *comp, ptrdiff_t K, ptrdiff_t N)
+{
+    ptrdiff_t N16 = (N + 15) / 16 * 16;
+    ptrdiff_t K4 = (K + 3) / 4;
+    memset(packed, 0, (size_t)(K4 * N16 * 4));
+    memset(comp, 0, (size_t)N16 * sizeof(int32_t));
+    for (ptrdiff_t k = 0; k < K; k++) {
+        for (ptrdiff_t n = 0; n < N; n++) {
+            int8_t v = b[k * N + n];
+            packed[((k / 4) * N16 + n) * 4 + (k % 4)] = v;
+            comp[n] += 128 * (int32_t)v;
+        }
+    }
+}
+
+/*
+ * 微内核：C[m0:m0+MR, n0:n0+nb*16] = A[rows] * B
+ * rows 为MR个A行指针（M不足MR时重复最后一行，结果不写回）；nb为编译期常量时完全展开
+ */
+static inline __attribute__((always_inline)) void micro_kernel(
+    const int8_t *const rows[MR], ptrdiff_t K, const int8_t *bp, ptrdiff_t N16, const int32_t *comp,
+    int32_t *c, ptrdiff_t ldc, ptrdiff_t mr, ptrdiff_t nvalid, const int nb)
+{
+    const __m512i flip = _mm512_set1_epi32((int)0x80808080u);
+    __m512i acc[MR][NB_MAX];
+    for (int i = 0; i < MR; i++)
+        for (int j = 0; j < nb; j++)
+            acc[i][j] = _mm512_setzero_si512();
+
+    ptrdiff_t K4full = K / 4;
+    ptrdiff_t k4 = 0;
+    for (; k4 < K4full; k4++) {
+        __m512i vb[NB_MAX];
+        for (int j = 0; j < nb; j++)
+            vb[j] = _mm512_loadu_si512((const void *)(bp + (k4 * N16 + j * 16) * 4));
+        for (int i = 0; i < MR; i++) {
+            int32_t w;
+            memcpy(&w, rows[i] + k4 * 4, 4);
+            /* 有符号int8按字节异或0x80转为u8 */
+            __m512i va = _mm512_xor_si512(_mm512_set1_epi32(w), flip);
+            for (int j = 0; j < nb; j++)
+                acc[i][j] = _mm512_dpbusd_epi32(acc[i][j], va, vb[j]);
+        }
+    }
+    if (k4 * 4 < K) {
+        /* K不是4的倍数：最后不足4个的字节补0，对应的B打包值为0，不影响结果 */
+        __m512i vb[NB_MAX];
+        for (int j = 0; j < nb; j++)
+            vb[j] = _mm512_loadu_si512((const void *)(bp + (k4 * N16 + j * 16) * 4));
+        for (int i = 0; i < MR; i++) {
+            int32_t w = 0;
+            memcpy(&w, rows[i] + k4 * 4, (size_t)(K - k4 * 4));
+            __m512i va = _mm512_xor_si512(_mm512_set1_epi32(w), flip);
+            for (int j = 0; j < nb; j++)
+                acc[i][j] = _mm512_dpbusd_epi32(acc[i][j], va, vb[j]);
+        }
+    }
+
+    for (int j = 0; j < nb; j++) {
+        ptrdiff_t left = nvalid - j * 16;
+        if (left <= 0)
+            break;
+        __mmask16 mask = left >= 16 ? (__mmask16)0xFFFF : (__mmask16)((1u << left) - 1);
+        __m512i vcomp = _mm512_loadu_si512((const void *)(comp + j * 16));
+        for (int i = 0; i < mr; i++)
+            _mm512_mask_storeu_epi32(c + i * ldc + j * 16, mask, _mm512_sub_epi32(acc[i][j], vcomp));
+    }
+}
+
+/*
+ * C = A * B
+ *
+ * a:      int8 (M, K)，C连续
+ * packed: pack_b_vnni 打包后的B
+ * comp:   pack_b_vnni 计算的补偿量
+ * c:      int32 (M, N)，C连续
+ */
+void gemm_s8s8s32_vnni(const int8_t *a, const int8_t *packed, const int32_t *comp, int32_t *c,
+                       ptrdiff_t M, ptrdiff_t K, ptrdiff_t N)
+{
+    ptrdiff_t N16 = (N + 15) / 16 * 16;
+
+    /* 外层按A的行块划分：行块的A在L1中，打包后的B在L2中被所有行块复用 */
+#pragma omp parallel for schedule(static)
+    for (ptrdiff_t m0 = 0; m0 < M; m0 += MR) {
+        ptrdiff_t mr = M - m0 < MR ? M - m0 : MR;
+        const int8_t *rows[MR];
+        for (int i = 0; i < MR; i++)
+            rows[i] = a + (m0 + (i < mr ? i : mr - 1)) * K;
+        for (ptrdiff_t n0 = 0; n0 < N16; n0 += NB_MAX * 16) {
+            ptrdiff_t nb = (N16 - n0) / 16 < NB_MAX ? (N16 - n0) / 16 : NB_MAX;
+            const int8_t *bp = packed + n0 * 4;
+            int32_t *cp = c + m0 * N + n0;
+            switch (nb) {
+            case 4: micro_kernel(rows, K, bp, N16, comp + n0, cp, N, mr, N - n0, 4); break;
+            case 3: micro_kernel(rows, K, bp, N16, comp + n0, cp, N, mr, N - n0, 3); break;
+            case 2: micro_kernel(rows, K, bp, N16, comp + n0, cp, N, mr, N - n0, 2); break;
+            default: micro_kernel(rows, K, bp, N16, comp + n0, cp, N, mr, N - n0, 1); break;
+            }
+        }
+    }
+}
+
+#else
+
+/* 未启用VNNI编译：vnni_supported() 返回0，以下函数不会被调用 */
+void pack_b_vnni(const int8_t *b, int8_t *packed, int32_t *comp, ptrdiff_t K, ptrdiff_t N)
+{
+    (void)b; (void)packed; (void)comp; (void)K; (void)N;
+}
+
+void gemm_s8s8s32_vnni(const int8_t *a, const int8_t *packed, const int32_t *comp, int32_t *c,
+                       ptrdiff_t M, ptrdiff_t K, ptrdiff_t N)
+{
+    (void)a; (void)packed; (void)comp; (void)c; (void)M; (void)K; (void)N;
+}
+
+#endif
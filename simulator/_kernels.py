@@ -0,0 +1,80 @@
+"""
+Numba 编译的 int8 卷积内核
+
+直接在 int8 输入和权重上计算，int32 累加，bias、右移与 clip 在内核中完成。
+未安装 numba 时导入本模块会抛出 ImportError，sim.py 会回退到 NumPy 实现。
+"""
+
+import numpy as np
+from numba import njit, prange
+
+
+# 已生成的特化卷积内核，键为 (k, stride, pad)
+_conv_kernels = {}
+
+
+def get_specialized_conv(k, stride, pad):
+    """
+    返回 kernel_size/stride/padding 固定为编译期常量的 int8 卷积内核
+    常量使 LLVM 可以完全展开 k*k 内层循环并去掉相关分支；每种参数组合只生成、编译一次
+
+    Args:
+        k: 卷积核大小
+        stride: 步长
+        pad: 填充
+
+    Returns:
+        内核函数 conv(input, weights, bias, shift)
+    """
+    key = (k, stride, pad)
+    kernel = _conv_kernels.get(key)
+    if kernel is None:
+        kernel = _make_conv_kernel(k, stride, pad)
+        _conv_kernels[key] = kernel
+    return kernel
+
+
+def _make_conv_kernel(k, stride, pad):
+    @njit(parallel=True, cache=True)
+    def conv_int8(input, weights, bias, shift):
+        """
+        int8 卷积内核
+
+        Args:
+            input: int8数组 (batch, in_c, in_h, in_w)
+            weights: int8数组 (out_c, in_c, k, k)
+            bias: int32数组 (out_c,)
+            shift: requant_shift
+
+        Returns:
+            int8数组 (batch, out_c, out_h, out_w)
+        """
+        batch_size, in_channels, in_height, in_width = input.shape
+        out_channels = weights.shape[0]
+        out_height = (in_height - k + 2 * pad) // stride + 1
+        out_width = (in_width - k + 2 * pad) // stride + 1
+
+        # 不生成填充后的输入副本：每个输出位置先算出落在输入内的卷积核区间，区间外即填充的0，直接跳过
+        output = np.empty((batch_size, out_channels, out_height, out_width), dtype=np.int8)
+        for idx in prange(batch_size * out_channels):
+            b = idx // out_channels
+            oc = idx % out_channels
+            for oh in range(out_height):
+                h_start = oh * stride - pad
+                kh_lo = max(0, -h_start)
+                kh_hi = min(k, in_height - h_start)
+                for ow in range(out_width):
+                    w_start = ow * stride - pad
+                    kw_lo = max(0, -w_start)
+                    kw_hi = min(k, in_width - w_start)
+                    acc = np.int32(0)
+                    for ic in range(in_channels):
+                        for kh in range(kh_lo, kh_hi):
+                            for kw in range(kw_lo, kw_hi):
+                                acc += np.int32(input[b, ic, h_start + kh, w_start + kw]) * np.int32(weights[oc, ic, kh, kw])
+                    acc = (acc + bias[oc]) >> shift
+                    output[b, oc, oh, ow] = min(max(acc, -127), 127)
+        return output
+
+    return conv_int8
+
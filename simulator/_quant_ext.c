@@ -0,0 +1,73 @@
+/*
+ * int8 量化/反量化的 AVX2 实现，通过 ctypes 由 sim.py 调用
+ *
+ * 编译（在 simulator 目录下）:
+ *     gcc -O3 -mavx2 -shared -fPIC -o _quant_ext.so _quant_ext.c
+ *
+ * 未启用 AVX2 编译时退化为标量实现，结果与 SimData 的 NumPy 实现逐位一致：
+ *     quant:   floor(clip(x * scale, -127, 127))
+ *     dequant: x * inv_scale (float32)
+ */
+
+#include <math.h>
+#include <stddef.h>
+#include <stdint.h>
+
+#ifdef __AVX2__
+#include <immintrin.h>
+#endif
+
+static inline int8_t quant_one(float x, float scale)
+{
+    float v = x * scale;
+    v = v < -127.0f ? -127.0f : v;
+    v = v > 127.0f ? 127.0f : v;
+    return (int8_t)floorf(v);
+}
+
+void quant_f32_int8(const float *in, int8_t *out, size_t n, float scale)
+{
+    size_t i = 0;
+#ifdef __AVX2__
+    const __m256 vscale = _mm256_set1_ps(scale);
+    const __m256 vmin = _mm256_set1_ps(-127.0f);
+    const __m256 vmax = _mm256_set1_ps(127.0f);
+    /* packs 按128位通道交错，最后用置换恢复顺序 */
+    const __m256i perm = _mm256_setr_epi32(0, 4, 1, 5, 2, 6, 3, 7);
+    for (; i + 32 <= n; i += 32) {
+        __m256i q[4];
+        for (int j = 0; j < 4; j++) {
+            __m256 v = _mm256_mul_ps(_mm256_loadu_ps(in + i + 8 * j), vscale);
+            v = _mm256_min_ps(_mm256_max_ps(v, vmin), vmax);
+            v = _mm256_floor_ps(v);
+            q[j] = _mm256_cvtps_epi32(v);
+        }
+        __m256i ab = _mm256_packs_epi32(q[0], q[1]);
+        __m256i cd = _mm256_packs_epi32(q[2], q[3]);
+        __m256i abcd = _mm256_packs_epi16(ab, cd);
+        abcd = _mm256_permutevar8x32_epi32(abcd, perm);
+        _mm256_storeu_si256((__m256i *)(out + i), abcd);
+    }
+#endif
+    for (; i < n; i++) {
+        out[i] = quant_one(in[i], scale);
+    }
+}
+
+void dequant_int8_f32(const int8_t *in, float *out, size_t n, float inv_scale)
+{
+    size_t i = 0;
+#ifdef __AVX2__
+    const __m256 vinv = _mm256_set1_ps(inv_scale);
+    for (; i + 32 <= n; i += 32) {
+        for (int j = 0; j < 4; j++) {
+            __m128i b = _mm_loadl_epi64((const __m128i *)(in + i + 8 * j));
+            __m256 v = _mm256_cvtepi32_ps(_mm256_cvtepi8_epi32(b));
+            _mm256_storeu_ps(out + i + 8 * j, _mm256_mul_ps(v, vinv));
+        }
+    }
+#endif
+    for (; i < n; i++) {
+        out[i] = (float)in[i] * inv_scale;
+    }
+}
@@ -0,0 +1,96 @@
+"""
+PyTorch 设备后端（如 CUDA）的 int8 卷积/全连接
+
+int8 值在浮点中可以精确表示，只要累加和的绝对值不超过尾数范围，
+浮点卷积/矩阵乘的结果就是精确整数，因此可以直接使用设备上的 conv2d/matmul，
+再在设备上完成 bias、右移与 clip。权重只拷贝到设备一次，激活在层间保留在设备上。
+未安装 torch 时导入本模块会抛出 ImportError。
+"""
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# float32 尾数可精确表示的整数上限
+_FP32_EXACT_LIMIT = 1 << 24
+
+
+def acc_dtype(reduce_size):
+    """
+    选择累加使用的浮点类型：|acc| <= 128*128*reduce_size（int8可取到-128）在 float32 中精确时用 float32，否则用 float64
+
+    Args:
+        reduce_size: 每个输出累加的乘积个数 (in_c*k*k 或 in_features)
+    """
+    if reduce_size * 128 * 128 < _FP32_EXACT_LIMIT:
+        return torch.float32
+    return torch.float64
+
+
+def to_device(data, device, dtype=None):
+    """
+    将numpy数组或tensor放到指定设备上
+
+    Args:
+        data: numpy数组或torch.Tensor
+        device: torch设备，例如 'cuda'
+        dtype: 可选的目标类型
+    """
+    if not isinstance(data, torch.Tensor):
+        data = np.ascontiguousarray(data)
+        if not data.flags.writeable:
+            # 只读数组（如内存映射的权重）不能直接共享给torch
+            data = data.copy()
+        data = torch.from_numpy(data)
+    return data.to(device=device, dtype=dtype)
+
+
+def _as_acc(input, dtype):
+    # 与NumPy路径一致，浮点输入先四舍五入到整数
+    if input.is_floating_point():
+        input = torch.round(input)
+    return input.to(dtype)
+
+
+def _requantize(acc, bias, shift):
+    # 浮点累加结果是整数，round只用来吸收卷积算法（如Winograd）引入的微小误差
+    acc = torch.round(acc).to(torch.int32)
+    acc += bias
+    acc >>= shift
+    return torch.clamp(acc, -127, 127).to(torch.int8)
+
+
+def conv_int8(input, weights, bias, stride, pad, shift):
+    """
+    设备上的int8卷积
+
+    Args:
+        input: 设备上的tensor (batch, in_c, in_h, in_w)，值为int8范围
+        weights: 设备上的浮点tensor (out_c, in_c, k, k)，类型由acc_dtype决定
+        bias: 设备上的int32 tensor (out_c,)
+        stride: 步长
+        pad: 填充
+        shift: requant_shift
+
+    Returns:
+        设备上的int8 tensor (batch, out_c, out_h, out_w)
+    """
+    acc = F.conv2d(_as_acc(input, weights.dtype), weights, stride=stride, padding=pad)
+    return _requantize(acc, bias.view(1, -1, 1, 1), shift)
+
+
+def fc_int8(input, weights, bias, shift):
+    """
+    设备上的int8全连接
+
+    Args:
+        input: 设备上的tensor (batch, in_features)，值为int8范围
+        weights: 设备上的浮点tensor (out_features, in_features)，类型由acc_dtype决定
+        bias: 设备上的int32 tensor (out_features,)
+        shift: requant_shift
+
+    Returns:
+        设备上的int8 tensor (batch, out_features)
+    """
+    acc = _as_acc(input, weights.dtype) @ weights.T
+    return _requantize(acc, bias.view(1, -1), shift)
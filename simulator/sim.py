@@ -1,5 +1,352 @@
+import ctypes
+import logging
+import os
+
 import numpy as np
 
+try:
+    # 可选的 numba 内核，未安装 numba 时回退到 NumPy 实现
+    from _kernels import get_specialized_conv as _get_specialized_conv
+except ImportError:
+    _get_specialized_conv = None
+
+logger = logging.getLogger(__name__)
+
+
+def _load_quant_ext():
+    """
+    加载可选的量化/反量化C扩展 _quant_ext.so（由 _quant_ext.c 编译，AVX2实现）
+    未编译或无法加载时返回None，回退到NumPy实现
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_quant_ext.so')
+    if not os.path.exists(path):
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError as e:
+        logger.warning("加载量化C扩展失败: %s", e)
+        return None
+    lib.quant_f32_int8.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_float]
+    lib.quant_f32_int8.restype = None
+    lib.dequant_int8_f32.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_float]
+    lib.dequant_int8_f32.restype = None
+    return lib
+
+_quant_ext = _load_quant_ext()
+
+# 元素数不少于该值时才调用C扩展，小数组上ctypes调用开销占主导
+_QUANT_EXT_MIN_SIZE = 1024
+
+
+def _load_vnni_ext():
+    """
+    加载可选的int8矩阵乘C扩展 _conv_vnni.so（由 _conv_vnni.c 编译，AVX-512 VNNI实现）
+    未编译、无法加载或CPU不支持VNNI时返回None，回退到torch/BLAS
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_conv_vnni.so')
+    if not os.path.exists(path):
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError as e:
+        logger.warning("加载VNNI C扩展失败: %s", e)
+        return None
+    lib.vnni_supported.argtypes = []
+    lib.vnni_supported.restype = ctypes.c_int
+    if not lib.vnni_supported():
+        return None
+    lib.pack_b_vnni.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                ctypes.c_ssize_t, ctypes.c_ssize_t]
+    lib.pack_b_vnni.restype = None
+    lib.gemm_s8s8s32_vnni.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                      ctypes.c_ssize_t, ctypes.c_ssize_t, ctypes.c_ssize_t]
+    lib.gemm_s8s8s32_vnni.restype = None
+    return lib
+
+_vnni_ext = _load_vnni_ext()
+
+
+def _get_torch_backend():
+    """按需导入PyTorch设备后端，避免未使用时导入torch的开销"""
+    try:
+        import _torch_backend
+    except ImportError as e:
+        raise ImportError(f"device后端需要安装PyTorch: {e}") from e
+    return _torch_backend
+
+# float32 尾数可精确表示的整数上限
+_FP32_EXACT_LIMIT = 1 << 24
+
+# torch._int_mm：int8 * int8 -> int32 GEMM，CPU上由oneDNN的VNNI内核执行；首次使用时按需导入
+_int_mm = None
+_int_mm_checked = False
+
+
+def _get_int_mm():
+    global _int_mm, _int_mm_checked
+    if not _int_mm_checked:
+        _int_mm_checked = True
+        try:
+            import torch
+            _int_mm = torch._int_mm
+        except (ImportError, AttributeError):
+            _int_mm = None
+    return _int_mm
+
+
+def _pack_int8_weights(b):
+    """
+    将int8权重矩阵 (K, N) 打包为VNNI内核使用的布局，并计算每列的补偿量
+    权重不变时打包结果由各层缓存，每次矩阵乘只做计算
+    
+    Args:
+        b: int8数组 (K, N)
+    
+    Returns:
+        (packed, comp)；VNNI扩展不可用时返回None
+    """
+    if _vnni_ext is None:
+        return None
+    b = np.ascontiguousarray(b, dtype=np.int8)
+    k, n = b.shape
+    n16 = (n + 15) // 16 * 16
+    packed = np.empty((k + 3) // 4 * n16 * 4, dtype=np.int8)
+    comp = np.empty(n16, dtype=np.int32)
+    _vnni_ext.pack_b_vnni(b.ctypes.data, packed.ctypes.data, comp.ctypes.data, k, n)
+    return packed, comp
+
+
+def _int8_matmul(a, b, out, b_packed=None):
+    """
+    int8 * int8 -> int32 矩阵乘
+    优先使用VNNI C扩展，其次 torch._int_mm，都直接在int8上计算；都不可用时转为浮点走BLAS：
+    int8乘积的累加和 |acc| <= 128*128*K（int8可取到-128），在尾数范围内时浮点结果是精确整数，
+    K较小时用float32，否则用float64，结果与int32累加逐位一致
+    
+    Args:
+        a: int8数组 (M, K)，只读时（如内存映射的输入）torch路径先拷贝一份
+        b: 可写的int8数组 (K, N)
+        out: int32输出 (M, N)，C连续
+        b_packed: _pack_int8_weights(b) 的缓存结果；为None时VNNI路径临时打包
+    
+    Returns:
+        out
+    """
+    if a.shape[1] != b.shape[0] or out.shape != (a.shape[0], b.shape[1]):
+        raise ValueError(f"矩阵乘形状不匹配: {a.shape} x {b.shape} -> {out.shape}")
+    if (_vnni_ext is not None and a.dtype == np.int8 and b.dtype == np.int8 and out.dtype == np.int32
+            and a.flags.c_contiguous and out.flags.c_contiguous):
+        # C扩展直接按裸指针读写，形状、类型和布局必须先检查
+        (m, k), n = a.shape, b.shape[1]
+        if b_packed is None:
+            b_packed = _pack_int8_weights(b)
+        packed, comp = b_packed
+        n16 = (n + 15) // 16 * 16
+        if packed.size != (k + 3) // 4 * n16 * 4 or comp.size != n16:
+            raise ValueError(f"打包权重与矩阵形状 {b.shape} 不匹配")
+        _vnni_ext.gemm_s8s8s32_vnni(a.ctypes.data, packed.ctypes.data, comp.ctypes.data, out.ctypes.data, m, k, n)
+        return out
+    int_mm = _get_int_mm()
+    if int_mm is not None:
+        import torch
+        if not a.flags.writeable:
+            # 只读数组不能直接共享给torch
+            a = a.copy()
+        try:
+            int_mm(torch.from_numpy(a), torch.from_numpy(b), out=torch.from_numpy(out))
+            return out
+        except RuntimeError:
+            # 形状/布局不被支持时回退到BLAS
+            pass
+    dtype = np.float32 if a.shape[1] * 128 * 128 < _FP32_EXACT_LIMIT else np.float64
+    np.copyto(out, np.matmul(a.astype(dtype), b.astype(dtype)), casting='unsafe')
+    return out
+
+
+# GEMM分块时每个patch块的字节数上限，使patch块与权重矩阵可以同时留在L2缓存中
+_IM2COL_TILE_BYTES = 256 * 1024
+# im2col patch缓冲区的字节数上限，batch按此分段展开
+_IM2COL_BUF_BYTES = 4 * 1024 * 1024
+
+
+def _to_nhwc(x):
+    """(batch, C, H, W) -> (batch, H, W, C) 的转置视图，写入目标缓冲区时才发生拷贝"""
+    return x.transpose(0, 2, 3, 1)
+
+
+def _valid_range(kk, stride, pad, in_size, out_size):
+    """
+    卷积核偏移为kk时，输入下标 o*stride - pad + kk 落在 [0, in_size) 内的输出区间 [start, end)
+    """
+    start = max(0, -((kk - pad) // stride))
+    end = min(out_size, (in_size - 1 + pad - kk) // stride + 1)
+    return start, max(start, end)
+
+
+def _im2col(x, cols, k, stride, pad, channels_last):
+    """
+    将未填充的int8输入展开到预先清零的patch缓冲区
+    对每个 (kh, kw) 先算出输入下标全部在界内的输出区间，区间内整块切片拷贝；
+    区间外对应填充区，缓冲区中保持为0，不需要逐元素边界判断，也不需要填充后的输入副本
+    
+    Args:
+        x: int8输入，NHWC (batch, H, W, in_c) 或 NCHW (batch, in_c, H, W)
+        cols: 已清零的int8缓冲区 (batch, out_h, out_w, ...)，后三维展平即为一行patch：
+              NHWC为 (k, k, in_c)；NCHW为 (in_c, k, k)，与权重 [in_channel, kernel_h, kernel_w] 顺序一致
+        k: 卷积核大小
+        stride: 步长
+        pad: 填充
+        channels_last: x是否为NHWC
+    """
+    if pad == 0 and channels_last:
+        # 无填充时所有patch都在界内：滑动窗口视图不拷贝数据，一次copyto整块写入缓冲区，
+        # 不需要逐 (kh, kw) 切片；NCHW下该拷贝的写入不连续，实测比逐偏移切片慢，不走此路径
+        windows = np.lib.stride_tricks.sliding_window_view(x, (k, k), axis=(1, 2))
+        np.copyto(cols, windows[:, ::stride, ::stride].transpose(0, 1, 2, 4, 5, 3))
+        return
+    in_height, in_width = x.shape[1:3] if channels_last else x.shape[2:4]
+    out_height, out_width = cols.shape[1:3]
+    for kh in range(k):
+        oh0, oh1 = _valid_range(kh, stride, pad, in_height, out_height)
+        if oh0 == oh1:
+            continue
+        ih = slice(oh0 * stride - pad + kh, (oh1 - 1) * stride - pad + kh + 1, stride)
+        for kw in range(k):
+            ow0, ow1 = _valid_range(kw, stride, pad, in_width, out_width)
+            if ow0 == ow1:
+                continue
+            iw = slice(ow0 * stride - pad + kw, (ow1 - 1) * stride - pad + kw + 1, stride)
+            if channels_last:
+                cols[:, oh0:oh1, ow0:ow1, kh, kw] = x[:, ih, iw]
+            else:
+                cols[:, oh0:oh1, ow0:ow1, :, kh, kw] = _to_nhwc(x[:, :, ih, iw])
+
+
+def _im2col_gemm(cols, weights_mat, acc, weights_packed=None):
+    """
+    将patch矩阵 (batch*out_h*out_w, patch_size) 按行分块，每块在L2中与权重矩阵相乘；
+    所有GEMM路径都分块，VNNI路径各块复用同一份缓存的打包权重，不重复打包
+    
+    Args:
+        cols: 连续的int8 patch数组 (batch, out_h, out_w, ...)，由_im2col填充；1x1卷积时即NHWC输入
+        weights_mat: 可写的int8权重矩阵 (patch_size, out_c)
+        acc: int32输出 (batch, out_h, out_w, out_c)，C连续
+        weights_packed: 缓存的VNNI打包权重，见 _pack_int8_weights
+    """
+    patch_size, out_channels = weights_mat.shape
+    patches = cols.reshape(-1, patch_size)
+    acc = acc.reshape(-1, out_channels)
+    tile_rows = max(1, _IM2COL_TILE_BYTES // patch_size)
+    for m in range(0, patches.shape[0], tile_rows):
+        _int8_matmul(patches[m:m + tile_rows], weights_mat, acc[m:m + tile_rows], weights_packed)
+
+
+def _map_int8_file(file_path, shape, kind):
+    """
+    将int8二进制文件只读内存映射为指定形状的数组，不读入、不拷贝
+    映射前用文件大小检查数据个数（int8每个值1字节）
+    
+    Args:
+        file_path: 二进制文件路径
+        shape: 数组形状
+        kind: 错误信息中的文件类型，如 "数据"、"权重"
+    
+    Returns:
+        只读的int8数组；它是文件的实时视图，需要与文件解耦时由调用方copy()
+    """
+    expected_size = int(np.prod(shape))
+    file_size = os.path.getsize(file_path)
+    if file_size != expected_size:
+        raise ValueError(f"{kind}文件大小不匹配。期望 {expected_size} 个值，实际得到 {file_size} 个值")
+    return np.memmap(file_path, dtype=np.int8, mode='r', shape=shape).view(np.ndarray)
+
+
+def _load_text_values(file_path, expected_size):
+    """
+    读取空白分隔的纯文本权重文件，由NumPy在C层直接解析为float32
+    
+    Args:
+        file_path: 文本文件路径
+        expected_size: 期望的数值个数
+    
+    Returns:
+        一维float32数组
+    """
+    values = np.fromfile(file_path, sep=' ', dtype=np.float32)
+    if len(values) != expected_size:
+        raise ValueError(f"权重文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(values)} 个值")
+    return values
+
+
+def _save_text_values(file_path, values):
+    """
+    将一维数组保存为纯文本，每行一个值
+    格式化在C层完成（savetxt逐行调用Python格式化），%.9g 可无损还原float32
+    """
+    with open(file_path, 'w') as f:
+        values.tofile(f, sep='\n', format='%.9g')
+        f.write('\n')
+
+
+def _grow_buffer(buf, size, dtype):
+    """
+    返回容量不小于size的一维scratch缓冲区：已有缓冲区足够大时原样返回（调用方取前size个元素的视图），
+    否则重新分配。形状变小或来回变化时不再重新分配
+    """
+    if buf is None or buf.size < size:
+        buf = np.empty(size, dtype=dtype)
+    return buf
+
+
+def _as_int8(data):
+    """
+    将层输入转换为int8：已是int8时直接使用，否则四舍五入后转换
+    层输出和 load_data_from_binary 的数据都是int8，层间不再重复转换
+    """
+    if data.dtype == np.int8:
+        return data
+    return np.round(data).astype(np.int8)
+
+
+def _requantize(acc, bias, shift, out):
+    """
+    int32累加结果的后处理：加bias、右移requant_shift、clip到int8范围 [-127, 127]
+    加bias和右移在acc上原地完成；clip直接写入int8输出，不再单独做一遍类型转换
+    
+    Args:
+        acc: int32累加结果，最后一维为输出通道，会被原地修改
+        bias: int32 bias，形状 (out,)
+        shift: requant_shift
+        out: int8输出，形状与acc相同，可以是转置视图
+    
+    Returns:
+        out
+    """
+    np.add(acc, bias, out=acc)
+    np.right_shift(acc, shift, out=acc)
+    # clip后的值都在int8范围内，unsafe转换不会截断
+    np.clip(acc, -127, 127, out=out, casting='unsafe')
+    return out
+
+
+def _debug_enabled():
+    """
+    环境变量 FPGA_SIM_DEBUG 设为非0值时，层的forward输出调试日志（logging DEBUG级别）
+    默认关闭，forward热路径上不做任何日志调用
+    """
+    return os.environ.get('FPGA_SIM_DEBUG', '0') not in ('', '0')
+
+
+def _q_scale(q):
+    """
+    量化位移q对应的比例因子 2^q (float)
+    q为整数位移，用整数移位得到精确的2的幂，不经过浮点pow；q<0时为 1 / 2^-q
+    """
+    if q >= 0:
+        return float(1 << q)
+    return 1.0 / (1 << -q)
+
+
 class SimData:
     def __init__(self, data=None, q=0):
         """
@@ -10,29 +357,51 @@ class SimData:
         """
         self.data = data
         self.q = q
-        self.scale = 2 ** q  # scale = 2^q
+        self.scale = _q_scale(q)  # scale = 2^q
+        self.inv_scale = _q_scale(-q)  # 1 / scale，反量化时相乘，不做除法
     
     def __repr__(self):
         """String representation for debugging"""
         if self.data is not None:
             return f"SimData(shape={self.data.shape}, q={self.q}, scale={self.scale:.6f}, range=[{np.min(self.data):.2f}, {np.max(self.data):.2f}])"
         return f"SimData(data=None, q={self.q}, scale={self.scale:.6f})"
+    
+    def to_numpy(self):
+        """
+        返回数据为numpy数组的SimData
+        device后端的输出保留在设备上，在网络边界处调用此方法拷回CPU
+        """
+        data = self.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        return SimData(data=data, q=self.q)
+    
+    def dequantize(self, out=None):
+        """
+        将int8数据反量化为float32，使用缓存的 inv_scale
+        
+        Args:
+            out: 可选的float32输出数组，形状需与data一致
+        """
+        return SimData.dequantize_from_int8(self.data, self.scale, out=out, inv_scale=self.inv_scale)
 
     @staticmethod
-    def quantize_to_int8(data, scale=None):
+    def quantize_to_int8(data, scale=None, out=None):
         """
         将浮点数据量化到int8范围 (-127 ~ 127)
         
         Args:
             data: 浮点数numpy数组
             scale: 量化比例因子，如果为None则自动计算
+            out: 可选的int8输出数组，形状需与data一致
         
         Returns:
             量化后的int8数组, 量化比例因子
         """
         if scale is None:
             # 自动计算量化比例因子
-            data_max = np.max(np.abs(data))
+            # |data|的最大值取自min/max两次归约，不分配np.abs临时数组
+            data_max = max(-float(np.min(data)), float(np.max(data)))
             if data_max == 0:
                 scale = 1.0
             else:
@@ -40,28 +409,53 @@ class SimData:
         
         # 量化到int8范围：先clip再floor再转换
         # 使用floor而不是round或trunc，这样与硬件行为一致
-        quantized = data * scale
-        quantized = np.clip(quantized, -127, 127)
-        quantized = np.floor(quantized).astype(np.int8)
+        if (_quant_ext is not None and isinstance(data, np.ndarray) and data.size >= _QUANT_EXT_MIN_SIZE
+                and data.dtype == np.float32 and data.flags.c_contiguous
+                and np.result_type(data, scale) == np.float32
+                and (out is None or (out.dtype == np.int8 and out.flags.c_contiguous and out.shape == data.shape))):
+            # float32输入走C扩展，计算过程与下面的NumPy实现逐位一致
+            if out is None:
+                out = np.empty(data.shape, dtype=np.int8)
+            _quant_ext.quant_f32_int8(data.ctypes.data, out.ctypes.data, data.size, scale)
+            return out, scale
+        
+        # 只分配一个临时缓冲区，clip和floor原地完成
+        buf = np.multiply(data, scale)
+        np.clip(buf, -127, 127, out=buf)
+        np.floor(buf, out=buf)
         
-        return quantized, scale
+        if out is None:
+            return buf.astype(np.int8), scale
+        np.copyto(out, buf, casting='unsafe')
+        return out, scale
     
     @staticmethod
-    def dequantize_from_int8(quantized_data, scale):
+    def dequantize_from_int8(quantized_data, scale, out=None, inv_scale=None):
         """
         将int8数据反量化到浮点数
         
         Args:
             quantized_data: int8数组
             scale: 量化比例因子
+            out: 可选的float32输出数组，形状需与quantized_data一致
+            inv_scale: 可选的预先计算的 1/scale（如 SimData.inv_scale）
         
         Returns:
             反量化后的浮点数组
         """
-        return quantized_data.astype(np.float32) / scale
+        if inv_scale is None:
+            inv_scale = 1.0 / scale
+        if (_quant_ext is not None and isinstance(quantized_data, np.ndarray) and quantized_data.size >= _QUANT_EXT_MIN_SIZE
+                and quantized_data.dtype == np.int8 and quantized_data.flags.c_contiguous
+                and (out is None or (out.dtype == np.float32 and out.flags.c_contiguous and out.shape == quantized_data.shape))):
+            if out is None:
+                out = np.empty(quantized_data.shape, dtype=np.float32)
+            _quant_ext.dequant_int8_f32(quantized_data.ctypes.data, out.ctypes.data, quantized_data.size, inv_scale)
+            return out
+        return np.multiply(quantized_data, inv_scale, out=out, dtype=np.float32)
     
     @staticmethod
-    def load_data_from_binary(file_path, n_channels, height, width, q=0):
+    def load_data_from_binary(file_path, n_channels, height, width, q=0, dtype=np.int8):
         """
         从二进制文件加载输入数据
         文件格式: binary (int8, 量化范围 -127 ~ 127)
@@ -74,31 +468,27 @@ class SimData:
             height: 高度
             width: 宽度
             q: 量化位移，scale = 2^q
+            dtype: 返回数据的类型，默认保持int8；需要旧的浮点数据时可传入 np.float32
         
         Returns:
-            SimData对象，包含数据和q信息
+            SimData对象，包含数据和q信息；int8数据是文件的只读映射，需要修改时先copy()
+        
+        注意:
+            映射与文件共享页缓存，SimData存活期间不要改写或截断源文件：
+            改写会改变已加载的数据，截断会使访问数据时进程收到SIGBUS
         """
         try:
-            # 读取二进制文件 (int8格式)
-            data_flat = np.fromfile(file_path, dtype=np.int8)
-            
-            # 检查数据大小
-            expected_size = n_channels * height * width
-            if len(data_flat) != expected_size:
-                raise ValueError(f"数据文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(data_flat)} 个值")
-            
             # 保持int8格式（不反量化），因为我们在int8域计算
-            # 重塑为正确的形状: [n_channel, height, width]
-            data = data_flat.reshape(n_channels, height, width)
-            
-            # 添加batch维度，返回 (1, n_channels, height, width)
-            data = np.expand_dims(data, axis=0).astype(np.float32)
+            # 以只读内存映射方式直接映射为 (1, n_channels, height, width)，不拷贝数据
+            data = _map_int8_file(file_path, (1, n_channels, height, width), "数据")
+            if data.dtype != dtype:
+                data = data.astype(dtype)
             
-            print(f"成功从二进制文件加载数据: {file_path}, 形状: {data.shape}, q={q}, scale={2**q}")
+            logger.info("成功从二进制文件加载数据: %s, 形状: %s, q=%s, scale=%s", file_path, data.shape, q, _q_scale(q))
             return SimData(data=data, q=q)
             
         except Exception as e:
-            print(f"加载二进制数据文件失败: {e}")
+            logger.error("加载二进制数据文件失败: %s", e)
             raise
     
     @staticmethod
@@ -125,7 +515,7 @@ class SimData:
                 raise ValueError(f"数据维度不正确。期望3D或4D数组，实际得到 {data.ndim}D")
             
             # 展平数据
-            data_flat = data.flatten()
+            data_flat = data.ravel()
             
             # 量化到int8格式
             quantized_data, used_scale = SimData.quantize_to_int8(data_flat, scale)
@@ -133,11 +523,11 @@ class SimData:
             # 保存为binary文件
             quantized_data.tofile(file_path)
             
-            print(f"成功保存数据到二进制文件: {file_path}, 形状: {data.shape}, 量化比例: {used_scale}")
+            logger.info("成功保存数据到二进制文件: %s, 形状: %s, 量化比例: %s", file_path, data.shape, used_scale)
             return used_scale
             
         except Exception as e:
-            print(f"保存二进制数据文件失败: {e}")
+            logger.error("保存二进制数据文件失败: %s", e)
             raise
     
     @staticmethod
@@ -173,17 +563,80 @@ class SimData:
         return data
 
 class ConvLayer:
-    def __init__(self, input_channels, output_channels, kernel_size, stride=1, padding=0):
+    def __init__(self, input_channels, output_channels, kernel_size, stride=1, padding=0, data_layout='NHWC', requant_rounding=False, device=None):
+        """
+        Args:
+            data_layout: NumPy im2col路径内部使用的数据布局，默认 'NHWC'，可选 'NCHW'
+                         'NHWC' 下通道维在最内层，im2col每个像素的通道向量连续，整段拷贝
+                         forward的输入输出始终为 (batch, n_channel, height, width)
+            requant_rounding: True时requant右移前加 1 << (shift-1)，即四舍五入；
+                              默认False为向下取整，与硬件行为一致
+            device: 为None时在CPU上用NumPy/Numba计算；设为torch设备（如 'cuda'）时使用PyTorch后端，
+                    权重只拷贝到设备一次，输出保留在设备上，可用 SimData.to_numpy() 取回
+        """
+        if data_layout not in ('NCHW', 'NHWC'):
+            raise ValueError(f"不支持的数据布局: {data_layout}，可选 'NCHW' 或 'NHWC'")
         self.input_channels = input_channels
         self.output_channels = output_channels
         self.kernel_size = kernel_size
         self.stride = stride
         self.padding = padding
+        self.data_layout = data_layout
+        self.requant_rounding = requant_rounding
+        self.device = device
+        self.debug = _debug_enabled()  # forward是否输出调试日志
+        self._device_qweights = None  # 缓存的设备端权重和bias
+        self._acc_buf = None  # forward复用的int32累加缓冲区
+        self._cols_buf = None  # forward复用的im2col缓冲区，只增不减，填充区保持为0
+        self._cols_key = None  # 当前im2col缓冲区内容对应的 (形状, 布局, stride, padding)
+        self.int8_native = False  # 权重是否以int8原生存储（从二进制文件加载）
+        self.weights_are_integer = False  # 权重是否为整数类型，整数权重量化时无需四舍五入
+        self.weights_int8 = None  # forward使用的int8权重
+        self._bias_int32 = None  # 缓存的int32 bias，形状 (out,)
+        self._weights_mat = None  # 缓存的GEMM布局int8权重，(数据布局, 矩阵, VNNI打包权重)
+        self._weights_dirty = True  # 权重变化后需重新量化
         self.weights = np.random.randn(output_channels, input_channels, kernel_size, kernel_size) * 0.01
         self.bias = np.zeros((output_channels, 1))
         self.weight_q = 0  # 权重的量化位移
         self.weight_scale = 1.0  # 权重的量化比例因子 = 2^weight_q
     
+    @property
+    def weights(self):
+        """
+        浮点形式的权重
+        从二进制文件加载时权重以int8原生存储，此时按需转换为float32（值仍是int8范围）
+        """
+        if self.int8_native:
+            return self.weights_int8.astype(np.float32)
+        return self._weights
+    
+    @weights.setter
+    def weights(self, value):
+        self._weights = value
+        self.int8_native = False
+        self.weights_are_integer = np.issubdtype(np.asarray(value).dtype, np.integer)
+        self._weights_dirty = True
+    
+    @property
+    def bias(self):
+        """bias，重新赋值后下一次forward会重新量化"""
+        return self._bias
+    
+    @bias.setter
+    def bias(self, value):
+        self._bias = value
+        self._weights_dirty = True
+    
+    @property
+    def weights_gemm_int8(self):
+        """
+        GEMM布局的int8权重 (patch_size, out_c)，C连续，行顺序与data_layout的patch一致
+        返回缓存矩阵的只读视图：就地修改会使缓存与权重、VNNI打包权重不一致，需要修改时先copy()
+        """
+        view = self._get_weights_mat().view()
+        view.flags.writeable = False
+        return view
+    
     def load_weights_from_text(self, file_path):
         """
         从纯文本文件加载权重
@@ -192,23 +645,17 @@ class ConvLayer:
         按行主序展平
         """
         try:
-            # 读取纯文本文件
-            with open(file_path, 'r') as f:
-                data = f.read().strip().split()
-            
-            # 转换为浮点数
-            weights_flat = np.array([float(x) for x in data])
-            
-            # 重塑为正确的形状
             expected_size = self.output_channels * self.input_channels * self.kernel_size * self.kernel_size
-            if len(weights_flat) != expected_size:
-                raise ValueError(f"权重文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(weights_flat)} 个值")
+            weights_flat = _load_text_values(file_path, expected_size)
             
+            # 重塑为正确的形状
             self.weights = weights_flat.reshape(self.output_channels, self.input_channels, self.kernel_size, self.kernel_size)
-            print(f"成功从文本文件加载权重: {file_path}")
+            # 加载时即生成GEMM布局的int8权重，第一次forward不再转置拷贝
+            self._get_weights_mat()
+            logger.info("成功从文本文件加载权重: %s", file_path)
             
         except Exception as e:
-            print(f"加载文本权重文件失败: {e}")
+            logger.error("加载文本权重文件失败: %s", e)
             raise
     
     def load_weights_from_binary(self, file_path, q=0):
@@ -223,39 +670,114 @@ class ConvLayer:
             q: 量化位移，scale = 2^q
         """
         try:
-            # 读取二进制文件 (int8格式)
-            weights_flat = np.fromfile(file_path, dtype=np.int8)
-            
-            # 检查数据大小
-            expected_size = self.output_channels * self.input_channels * self.kernel_size * self.kernel_size
-            if len(weights_flat) != expected_size:
-                raise ValueError(f"权重文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(weights_flat)} 个值")
-            
-            # 保持int8格式（存储为float32但值是int8范围）
-            weights_flat = weights_flat.astype(np.float32)
-            
-            # 重塑为正确的形状
-            self.weights = weights_flat.reshape(self.output_channels, self.input_channels, self.kernel_size, self.kernel_size)
+            # 读取二进制文件 (int8格式) 的快照：映射后立即拷贝，之后改写或截断原文件不会影响
+            # 已加载的权重及其缓存的GEMM矩阵；保持int8格式原生存储，forward直接使用，不经过float32往返
+            shape = (self.output_channels, self.input_channels, self.kernel_size, self.kernel_size)
+            self.weights_int8 = _map_int8_file(file_path, shape, "权重").copy()
+            self._weights = None
+            self.int8_native = True
+            self.weights_are_integer = True
             self.weight_q = q  # 保存权重的量化位移
-            self.weight_scale = 2 ** q  # 计算量化比例因子
-            print(f"成功从二进制文件加载权重: {file_path}, q={q}, scale={self.weight_scale}")
+            self.weight_scale = _q_scale(q)  # 计算量化比例因子
+            self._weights_dirty = True
+            # 加载时即生成GEMM布局的int8权重，第一次forward不再转置拷贝
+            self._get_weights_mat()
+            logger.info("成功从二进制文件加载权重: %s, q=%s, scale=%s", file_path, q, self.weight_scale)
             
         except Exception as e:
-            print(f"加载二进制权重文件失败: {e}")
+            logger.error("加载二进制权重文件失败: %s", e)
             raise
     
+    def _get_qweights(self):
+        """
+        返回forward使用的int8权重和int32 bias
+        权重在两次forward之间不变，只在权重或bias变化后重新量化一次；
+        从二进制文件加载的int8权重直接使用，无需量化；整数类型的权重只做类型转换，不做四舍五入
+        
+        Returns:
+            (int8权重, int32 bias)
+        """
+        if self._weights_dirty:
+            if not self.int8_native:
+                if self.weights_are_integer:
+                    self.weights_int8 = np.asarray(self._weights).astype(np.int8)
+                else:
+                    self.weights_int8 = np.round(self._weights).astype(np.int8)
+            self._bias_int32 = np.round(self._bias).astype(np.int32).reshape(-1)
+            self._weights_mat = None
+            self._weights_dirty = False
+        return self.weights_int8, self._bias_int32
+    
+    def _get_weights_mat(self):
+        """
+        返回im2col-GEMM使用的int8权重矩阵 (patch_size, out_c)，行顺序与当前数据布局的patch一致
+        只在权重变化或数据布局改变后重新生成，forward不再每次转置拷贝权重
+        """
+        self._get_qweights()
+        cached = self._weights_mat
+        if cached is None or cached[0] != self.data_layout:
+            if self.data_layout == 'NHWC':
+                # 权重转换为 (out_c, k, k, in_c) 后重塑为 (k*k*in_c, out_c)
+                weights_mat = np.array(_to_nhwc(self.weights_int8).reshape(self.output_channels, -1).T, order='C')
+            else:
+                # 权重重塑为 (in_c*k*k, out_c)
+                weights_mat = np.array(self.weights_int8.reshape(self.output_channels, -1).T, order='C')
+            self._weights_mat = cached = (self.data_layout, weights_mat, _pack_int8_weights(weights_mat))
+        return cached[1]
+    
+    def _get_weights_packed(self):
+        """返回与 _get_weights_mat 同步缓存的VNNI打包权重；VNNI扩展不可用时为None"""
+        self._get_weights_mat()
+        return self._weights_mat[2]
+    
+    def _get_device_qweights(self, backend):
+        """
+        返回设备上的权重和int32 bias，只在int8权重或bias变化后重新拷贝到设备
+        
+        Returns:
+            (设备上的浮点权重, 设备上的int32 bias)
+        """
+        weights_int8, bias_int32 = self._get_qweights()
+        cached = self._device_qweights
+        if cached is None or cached[0] is not weights_int8 or cached[1] is not bias_int32:
+            dtype = backend.acc_dtype(weights_int8[0].size)
+            self._device_qweights = (weights_int8, bias_int32,
+                                     backend.to_device(weights_int8, self.device, dtype),
+                                     backend.to_device(bias_int32, self.device))
+        return self._device_qweights[2], self._device_qweights[3]
+    
+    def _get_acc_buf(self, shape):
+        """
+        返回forward使用的int32累加缓冲区，取自只增不减的缓冲区的视图，避免每次调用重新分配
+        缓冲区只在forward内部使用，返回的输出数据不与其共享内存
+        """
+        size = int(np.prod(shape))
+        self._acc_buf = _grow_buffer(self._acc_buf, size, np.int32)
+        return self._acc_buf[:size].reshape(shape)
+    
+    def _get_cols_buf(self, shape):
+        """
+        返回im2col使用的int8 patch缓冲区
+        只在形状、布局或卷积参数变化时清零（容量不足时才重新分配）；之后每次只覆盖界内区域，
+        填充区始终为0，无需重新清零
+        """
+        size = int(np.prod(shape))
+        key = (shape, self.data_layout, self.stride, self.padding)
+        if self._cols_key != key:
+            self._cols_buf = _grow_buffer(self._cols_buf, size, np.int8)
+            self._cols_buf[:size] = 0
+            self._cols_key = key
+        return self._cols_buf[:size].reshape(shape)
+    
     def save_weights_to_text(self, file_path):
         """
         将权重保存为纯文本文件
         """
         try:
-            weights_flat = self.weights.flatten()
-            with open(file_path, 'w') as f:
-                for weight in weights_flat:
-                    f.write(f"{weight}\n")
-            print(f"成功保存权重到文本文件: {file_path}")
+            _save_text_values(file_path, self.weights.ravel())
+            logger.info("成功保存权重到文本文件: %s", file_path)
         except Exception as e:
-            print(f"保存文本权重文件失败: {e}")
+            logger.error("保存文本权重文件失败: %s", e)
             raise
     
     def save_weights_to_binary(self, file_path, scale=None):
@@ -271,7 +793,7 @@ class ConvLayer:
             量化比例因子
         """
         try:
-            weights_flat = self.weights.flatten()
+            weights_flat = self.weights.ravel()
             
             # 量化到int8格式
             quantized_weights, used_scale = SimData.quantize_to_int8(weights_flat, scale)
@@ -279,10 +801,10 @@ class ConvLayer:
             # 保存为binary文件
             quantized_weights.tofile(file_path)
             
-            print(f"成功保存权重到二进制文件: {file_path}, 量化比例: {used_scale}")
+            logger.info("成功保存权重到二进制文件: %s, 量化比例: %s", file_path, used_scale)
             return used_scale
         except Exception as e:
-            print(f"保存二进制权重文件失败: {e}")
+            logger.error("保存二进制权重文件失败: %s", e)
             raise
 
     def forward(self, input_simdata, output_q=0):
@@ -295,71 +817,142 @@ class ConvLayer:
             output_q: 期望的输出量化位移，output_scale = 2^output_q
         
         Returns:
-            SimData对象，包含int8量化后的输出数据和q
+            SimData对象，包含int8量化后的输出数据（dtype为int8）和q
         """
         input_data = input_simdata.data
         input_q = input_simdata.q
+        if input_data.ndim != 4 or input_data.shape[1] != self.input_channels:
+            raise ValueError(f"输入通道数不匹配。期望形状 (batch, {self.input_channels}, height, width)，实际得到 {tuple(input_data.shape)}")
         
         # 计算requant_shift
         requant_shift = input_q + self.weight_q - output_q
         
-        # print(f"  [ConvLayer] input_q={input_q}, weight_q={self.weight_q}, output_q={output_q}")
-        # print(f"  [ConvLayer] 计算得到 requant_shift={requant_shift}")
+        if self.debug:
+            logger.debug("[ConvLayer] input_q=%s, weight_q=%s, output_q=%s", input_q, self.weight_q, output_q)
+            logger.debug("[ConvLayer] 计算得到 requant_shift=%s", requant_shift)
+        
+        if self.device is not None:
+            backend = _get_torch_backend()
+            weights_dev, bias_dev = self._get_device_qweights(backend)
+            if self.requant_rounding and requant_shift > 0:
+                bias_dev = bias_dev + (1 << (requant_shift - 1))
+            output_data = backend.conv_int8(backend.to_device(input_data, self.device), weights_dev, bias_dev,
+                                            self.stride, self.padding, requant_shift)
+            return SimData(data=output_data, q=output_q)
         
         batch_size, in_channels, in_height, in_width = input_data.shape
         out_height = (in_height - self.kernel_size + 2 * self.padding) // self.stride + 1
         out_width = (in_width - self.kernel_size + 2 * self.padding) // self.stride + 1
         
-        # 转换为int8（四舍五入）
-        input_int8 = np.round(input_data).astype(np.int8)
-        weights_int8 = np.round(self.weights).astype(np.int8)
-        bias_int8 = np.round(self.bias).astype(np.int32)
-        
-        # 输出数组
-        output_data = np.zeros((batch_size, self.output_channels, out_height, out_width), dtype=np.float32)
-        
-        if self.padding > 0:
-            input_int8 = np.pad(input_int8, ((0, 0), (0, 0), (self.padding, self.padding), (self.padding, self.padding)), mode='constant')
-        
-        for b in range(batch_size):
-            for oc in range(self.output_channels):
-                for oh in range(out_height):
-                    for ow in range(out_width):
-                        h_start = oh * self.stride
-                        w_start = ow * self.stride
-                        h_end = h_start + self.kernel_size
-                        w_end = w_start + self.kernel_size
-                        
-                        # 在int32域进行乘法累加，避免溢出
-                        acc = np.int32(0)
-                        for ic in range(in_channels):
-                            for kh in range(self.kernel_size):
-                                for kw in range(self.kernel_size):
-                                    # int8 * int8 -> int32
-                                    inp_val = np.int32(input_int8[b, ic, h_start+kh, w_start+kw])
-                                    weight_val = np.int32(weights_int8[oc, ic, kh, kw])
-                                    acc += inp_val * weight_val
-                        
-                        # 加上bias
-                        acc += bias_int8[oc, 0]
-                        
-                        # Requantization: 右移指定位数
-                        acc = acc >> requant_shift
-                        
-                        # clip到int8范围 [-127, 127]
-                        output_data[b, oc, oh, ow] = np.float32(np.clip(acc, -127, 127))
+        # 转换为int8（四舍五入），int8输入直接使用
+        input_int8 = _as_int8(input_data)
+        weights_int8, bias_int32 = self._get_qweights()
+        if self.requant_rounding and requant_shift > 0:
+            # 舍入常数并入bias，后处理仍只做一次加法
+            bias_int32 = bias_int32 + (1 << (requant_shift - 1))
+        
+        p = self.padding
+        k = self.kernel_size
+        
+        # 1x1卷积（pointwise）的每行patch就是一个像素的通道向量，不需要im2col
+        pointwise = k == 1 and p == 0 and self.stride == 1
+        
+        # 默认走im2col-GEMM；当单个样本的patch矩阵就超过缓冲区上限、分段无法限制im2col内存时，
+        # 改用numba直接卷积内核（不展开patch矩阵）。内核按当前的 kernel_size/stride/padding 特化，
+        # 每次forward查找（已编译的内核有缓存），修改这些属性后仍然正确
+        sample_bytes = out_height * out_width * in_channels * k * k
+        if not pointwise and _get_specialized_conv is not None and sample_bytes > _IM2COL_BUF_BYTES:
+            conv_kernel = _get_specialized_conv(k, self.stride, p)
+            output_data = conv_kernel(input_int8, weights_int8, bias_int32, requant_shift)
+            return SimData(data=output_data, q=output_q)
+        
+        # int8 * int8 -> int32 累加
+        acc = self._get_acc_buf((batch_size, out_height, out_width, self.output_channels))
+        weights_mat = self._get_weights_mat()
+        weights_packed = self._get_weights_packed()
+        if pointwise:
+            # 输入转为连续的 (batch, H, W, in_c)，直接与 (in_c, out_c) 权重做GEMM
+            _im2col_gemm(np.array(_to_nhwc(input_int8), order='C'), weights_mat, acc, weights_packed)
+        else:
+            # batch按缓冲区上限分段，每段展开到同一个缓冲区后做GEMM
+            chunk = min(batch_size, max(1, _IM2COL_BUF_BYTES // sample_bytes))
+            if self.data_layout == 'NHWC':
+                # 输入转为 (batch, H, W, in_c) 视图，由_im2col直接拷贝每个像素连续的通道向量
+                x = _to_nhwc(input_int8)
+                cols = self._get_cols_buf((chunk, out_height, out_width, k, k, in_channels))
+            else:
+                x = input_int8
+                cols = self._get_cols_buf((chunk, out_height, out_width, in_channels, k, k))
+            for b in range(0, batch_size, chunk):
+                n = min(chunk, batch_size - b)
+                _im2col(x[b:b + n], cols[:n], k, self.stride, p, self.data_layout == 'NHWC')
+                _im2col_gemm(cols[:n], weights_mat, acc[b:b + n], weights_packed)
+        
+        # 加上bias、Requantization右移、clip到int8范围 [-127, 127]
+        # 结果经转置视图直接写入 (batch, out_c, out_h, out_w) 的int8输出
+        output_data = np.empty((batch_size, self.output_channels, out_height, out_width), dtype=np.int8)
+        _requantize(acc, bias_int32, requant_shift, _to_nhwc(output_data))
         
         return SimData(data=output_data, q=output_q)
 
 class FcLayer:
-    def __init__(self, input_size, output_size):
+    def __init__(self, input_size, output_size, requant_rounding=False, device=None):
         self.input_size = input_size
         self.output_size = output_size
+        self.requant_rounding = requant_rounding  # True时requant右移采用四舍五入，默认向下取整
+        self.device = device  # None为CPU上NumPy/Numba计算，否则为PyTorch设备（如 'cuda'）
+        self.debug = _debug_enabled()  # forward是否输出调试日志
+        self._device_qweights = None  # 缓存的设备端权重和bias
+        self._acc_buf = None  # forward复用的int32累加缓冲区
+        self.int8_native = False  # 权重是否以int8原生存储（从二进制文件加载）
+        self.weights_are_integer = False  # 权重是否为整数类型，整数权重量化时无需四舍五入
+        self.weights_int8 = None  # forward使用的int8权重
+        self._bias_int32 = None  # 缓存的int32 bias，形状 (out,)
+        self._weights_mat = None  # 缓存的转置int8权重 (in, out)
+        self._weights_packed = None  # 与_weights_mat同步缓存的VNNI打包权重
+        self._weights_dirty = True  # 权重变化后需重新量化
         self.weights = np.random.randn(output_size, input_size) * 0.01
         self.bias = np.zeros((output_size, 1))
         self.weight_q = 0  # 权重的量化位移
         self.weight_scale = 1.0  # 权重的量化比例因子 = 2^weight_q
     
+    @property
+    def weights(self):
+        """
+        浮点形式的权重
+        从二进制文件加载时权重以int8原生存储，此时按需转换为float32（值仍是int8范围）
+        """
+        if self.int8_native:
+            return self.weights_int8.astype(np.float32)
+        return self._weights
+    
+    @weights.setter
+    def weights(self, value):
+        self._weights = value
+        self.int8_native = False
+        self.weights_are_integer = np.issubdtype(np.asarray(value).dtype, np.integer)
+        self._weights_dirty = True
+    
+    @property
+    def bias(self):
+        """bias，重新赋值后下一次forward会重新量化"""
+        return self._bias
+    
+    @bias.setter
+    def bias(self, value):
+        self._bias = value
+        self._weights_dirty = True
+    
+    @property
+    def weights_gemm_int8(self):
+        """
+        GEMM布局的int8权重 (in, out)，C连续
+        返回缓存矩阵的只读视图：就地修改会使缓存与权重、VNNI打包权重不一致，需要修改时先copy()
+        """
+        view = self._get_weights_mat().view()
+        view.flags.writeable = False
+        return view
+    
     def load_weights_from_text(self, file_path):
         """
         从纯文本文件加载权重
@@ -368,23 +961,17 @@ class FcLayer:
         按行主序展平
         """
         try:
-            # 读取纯文本文件
-            with open(file_path, 'r') as f:
-                data = f.read().strip().split()
-            
-            # 转换为浮点数
-            weights_flat = np.array([float(x) for x in data])
-            
-            # 重塑为正确的形状
             expected_size = self.output_size * self.input_size
-            if len(weights_flat) != expected_size:
-                raise ValueError(f"权重文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(weights_flat)} 个值")
+            weights_flat = _load_text_values(file_path, expected_size)
             
+            # 重塑为正确的形状
             self.weights = weights_flat.reshape(self.output_size, self.input_size)
-            print(f"成功从文本文件加载权重: {file_path}")
+            # 加载时即生成GEMM布局的int8权重，第一次forward不再转置拷贝
+            self._get_weights_mat()
+            logger.info("成功从文本文件加载权重: %s", file_path)
             
         except Exception as e:
-            print(f"加载文本权重文件失败: {e}")
+            logger.error("加载文本权重文件失败: %s", e)
             raise
     
     def load_weights_from_binary(self, file_path, q=0):
@@ -399,39 +986,89 @@ class FcLayer:
             q: 量化位移，scale = 2^q
         """
         try:
-            # 读取二进制文件 (int8格式)
-            weights_flat = np.fromfile(file_path, dtype=np.int8)
-            
-            # 检查数据大小
-            expected_size = self.output_size * self.input_size
-            if len(weights_flat) != expected_size:
-                raise ValueError(f"权重文件大小不匹配。期望 {expected_size} 个值，实际得到 {len(weights_flat)} 个值")
-            
-            # 保持int8格式（存储为float32但值是int8范围）
-            weights_flat = weights_flat.astype(np.float32)
-            
-            # 重塑为正确的形状
-            self.weights = weights_flat.reshape(self.output_size, self.input_size)
+            # 读取二进制文件 (int8格式) 的快照：映射后立即拷贝，之后改写或截断原文件不会影响
+            # 已加载的权重及其缓存的GEMM矩阵；保持int8格式原生存储，forward直接使用，不经过float32往返
+            self.weights_int8 = _map_int8_file(file_path, (self.output_size, self.input_size), "权重").copy()
+            self._weights = None
+            self.int8_native = True
+            self.weights_are_integer = True
             self.weight_q = q  # 保存权重的量化位移
-            self.weight_scale = 2 ** q  # 计算量化比例因子
-            print(f"成功从二进制文件加载权重: {file_path}, q={q}, scale={self.weight_scale}")
+            self.weight_scale = _q_scale(q)  # 计算量化比例因子
+            self._weights_dirty = True
+            # 加载时即生成GEMM布局的int8权重，第一次forward不再转置拷贝
+            self._get_weights_mat()
+            logger.info("成功从二进制文件加载权重: %s, q=%s, scale=%s", file_path, q, self.weight_scale)
             
         except Exception as e:
-            print(f"加载二进制权重文件失败: {e}")
+            logger.error("加载二进制权重文件失败: %s", e)
             raise
     
+    def _get_qweights(self):
+        """
+        返回forward使用的int8权重和int32 bias
+        权重在两次forward之间不变，只在权重或bias变化后重新量化一次；
+        从二进制文件加载的int8权重直接使用，无需量化；整数类型的权重只做类型转换，不做四舍五入
+        
+        Returns:
+            (int8权重, int32 bias)
+        """
+        if self._weights_dirty:
+            if not self.int8_native:
+                if self.weights_are_integer:
+                    self.weights_int8 = np.asarray(self._weights).astype(np.int8)
+                else:
+                    self.weights_int8 = np.round(self._weights).astype(np.int8)
+            self._bias_int32 = np.round(self._bias).astype(np.int32).reshape(-1)
+            self._weights_mat = None
+            self._weights_packed = None
+            self._weights_dirty = False
+        return self.weights_int8, self._bias_int32
+    
+    def _get_weights_mat(self):
+        """
+        返回GEMM使用的转置int8权重矩阵 (in, out)，C连续
+        只在权重变化后重新生成，forward不再每次转置拷贝权重
+        """
+        self._get_qweights()
+        if self._weights_mat is None:
+            self._weights_mat = np.array(self.weights_int8.T, order='C')
+            self._weights_packed = _pack_int8_weights(self._weights_mat)
+        return self._weights_mat
+    
+    def _get_device_qweights(self, backend):
+        """
+        返回设备上的权重和int32 bias，只在int8权重或bias变化后重新拷贝到设备
+        
+        Returns:
+            (设备上的浮点权重, 设备上的int32 bias)
+        """
+        weights_int8, bias_int32 = self._get_qweights()
+        cached = self._device_qweights
+        if cached is None or cached[0] is not weights_int8 or cached[1] is not bias_int32:
+            dtype = backend.acc_dtype(weights_int8[0].size)
+            self._device_qweights = (weights_int8, bias_int32,
+                                     backend.to_device(weights_int8, self.device, dtype),
+                                     backend.to_device(bias_int32, self.device))
+        return self._device_qweights[2], self._device_qweights[3]
+    
+    def _get_acc_buf(self, shape):
+        """
+        返回forward使用的int32累加缓冲区，取自只增不减的缓冲区的视图，避免每次调用重新分配
+        缓冲区只在forward内部使用，返回的输出数据不与其共享内存
+        """
+        size = int(np.prod(shape))
+        self._acc_buf = _grow_buffer(self._acc_buf, size, np.int32)
+        return self._acc_buf[:size].reshape(shape)
+    
     def save_weights_to_text(self, file_path):
         """
         将权重保存为纯文本文件
         """
         try:
-            weights_flat = self.weights.flatten()
-            with open(file_path, 'w') as f:
-                for weight in weights_flat:
-                    f.write(f"{weight}\n")
-            print(f"成功保存权重到文本文件: {file_path}")
+            _save_text_values(file_path, self.weights.ravel())
+            logger.info("成功保存权重到文本文件: %s", file_path)
         except Exception as e:
-            print(f"保存文本权重文件失败: {e}")
+            logger.error("保存文本权重文件失败: %s", e)
             raise
     
     def save_weights_to_binary(self, file_path, scale=None):
@@ -447,7 +1084,7 @@ class FcLayer:
             量化比例因子
         """
         try:
-            weights_flat = self.weights.flatten()
+            weights_flat = self.weights.ravel()
             
             # 量化到int8格式
             quantized_weights, used_scale = SimData.quantize_to_int8(weights_flat, scale)
@@ -455,10 +1092,10 @@ class FcLayer:
             # 保存为binary文件
             quantized_weights.tofile(file_path)
             
-            print(f"成功保存权重到二进制文件: {file_path}, 量化比例: {used_scale}")
+            logger.info("成功保存权重到二进制文件: %s, 量化比例: %s", file_path, used_scale)
             return used_scale
         except Exception as e:
-            print(f"保存二进制权重文件失败: {e}")
+            logger.error("保存二进制权重文件失败: %s", e)
             raise
     
     def forward(self, input_simdata, output_q=0):
@@ -468,52 +1105,50 @@ class FcLayer:
         
         Args:
             input_simdata: SimData对象，包含int8量化后的输入数据和q
-                          可以是4D (batch, channels, h, w) 或 2D (batch, features)
+                          可以是4D (batch, channels, h, w)、2D (batch, features) 或其他以batch开头的形状
             output_q: 期望的输出量化位移，output_scale = 2^output_q
         
         Returns:
-            SimData对象，包含int8量化后的输出数据和q
+            SimData对象，包含int8量化后的输出数据（dtype为int8）和q
         """
         input_data = input_simdata.data
         input_q = input_simdata.q
         
-        # 如果输入是4D，展平为2D
-        if input_data.ndim == 4:
-            batch_size = input_data.shape[0]
-            input_data = input_data.reshape(batch_size, -1)
-        
+        # 如果输入不是2D（如4D特征图），展平为 (batch, features)，是视图不拷贝
         batch_size = input_data.shape[0]
+        if input_data.ndim != 2:
+            input_data = input_data.reshape(batch_size, -1)
+        if input_data.shape[1] != self.input_size:
+            raise ValueError(f"输入特征数不匹配。期望 {self.input_size} 个值，实际得到 {input_data.shape[1]} 个值")
         
         # 计算requant_shift
         # requant_shift = input_q + weight_q - output_q
         requant_shift = input_q + self.weight_q - output_q
         
-        print(f"  [FcLayer] input_q={input_q}, weight_q={self.weight_q}, output_q={output_q}")
-        print(f"  [FcLayer] 计算得到 requant_shift={requant_shift}")
-        
-        # 转换为int8
-        input_int8 = np.round(input_data).astype(np.int8)
-        weights_int8 = np.round(self.weights).astype(np.int8)
-        bias_int8 = np.round(self.bias).astype(np.int32)
-        
-        # 输出数组
-        output_data = np.zeros((batch_size, self.output_size), dtype=np.float32)
-        
-        for b in range(batch_size):
-            for o in range(self.output_size):
-                # 在int32域进行乘法累加
-                acc = np.int32(0)
-                for i in range(self.input_size):
-                    # int8 * int8 -> int32
-                    acc += np.int32(input_int8[b, i]) * np.int32(weights_int8[o, i])
-                
-                # 加上bias
-                acc += bias_int8[o, 0]
-                
-                # Requantization: 右移指定位数
-                acc = acc >> requant_shift
-                
-                # clip到int8范围 [-127, 127]
-                output_data[b, o] = np.float32(np.clip(acc, -127, 127))
+        if self.debug:
+            logger.debug("[FcLayer] input_q=%s, weight_q=%s, output_q=%s", input_q, self.weight_q, output_q)
+            logger.debug("[FcLayer] 计算得到 requant_shift=%s", requant_shift)
+        
+        if self.device is not None:
+            backend = _get_torch_backend()
+            weights_dev, bias_dev = self._get_device_qweights(backend)
+            if self.requant_rounding and requant_shift > 0:
+                bias_dev = bias_dev + (1 << (requant_shift - 1))
+            output_data = backend.fc_int8(backend.to_device(input_data, self.device), weights_dev, bias_dev, requant_shift)
+            return SimData(data=output_data, q=output_q)
+        
+        # 转换为int8，int8输入直接使用
+        input_int8 = _as_int8(input_data)
+        bias_int32 = self._get_qweights()[1]
+        if self.requant_rounding and requant_shift > 0:
+            # 舍入常数并入bias，后处理仍只做一次加法
+            bias_int32 = bias_int32 + (1 << (requant_shift - 1))
+        
+        # int8 * int8 -> int32 累加，一次矩阵乘完成（VNNI / torch._int_mm / BLAS）
+        acc = self._get_acc_buf((batch_size, self.output_size))
+        _int8_matmul(input_int8, self._get_weights_mat(), acc, self._weights_packed)
+        
+        # 加上bias、Requantization右移、clip到int8范围 [-127, 127]
+        output_data = _requantize(acc, bias_int32, requant_shift, np.empty(acc.shape, dtype=np.int8))
         
         return SimData(data=output_data, q=output_q)
\ No newline at end of file
@@ -6,6 +6,7 @@ from binary test data files.
 """
 
 import pytest
+import sim
 from sim import ConvLayer, FcLayer, SimData
 import os
 import numpy as np
@@ -54,6 +55,28 @@ def layers():
     }
 
 
+# Conv layer inputs: name -> (n_channels, height, width, q)
+CONV_INPUTS = {
+    'conv1': (1, 32, 32, 7),
+    'conv2': (32, 16, 16, 5),
+    'conv3': (64, 16, 16, 5),
+    'conv4': (64, 8, 8, 5),
+}
+
+
+@pytest.fixture(scope="class")
+def batched_conv_outputs(layers):
+    """Run each int8 conv layer once on all test inputs stacked along the batch dimension."""
+    outputs = {}
+    for name, (n_channels, height, width, q) in CONV_INPUTS.items():
+        stacked = np.concatenate([
+            SimData.load_data_from_binary(str(DATA_DIR / d / f"{name}.input.dat"), n_channels, height, width, q=q).data
+            for d in TEST_DIRS
+        ], axis=0)
+        outputs[name] = layers[f'{name}_int8'].forward(SimData(data=stacked, q=q), output_q=5)
+    return outputs
+
+
 def assert_arrays_equal_with_details(actual, expected, layer_name):
     """
     Assert that two arrays are equal and provide detailed diagnostic info if not.
@@ -70,7 +93,8 @@ def assert_arrays_equal_with_details(actual, expected, layer_name):
     print(f"{layer_name} - 期望输出范围: [{np.min(expected):.6f}, {np.max(expected):.6f}]")
     
     if not np.array_equal(actual, expected):
-        diff = np.abs(actual - expected)
+        # 先扩展到int32再相减，避免int8数据相减溢出
+        diff = np.abs(actual.astype(np.int32) - expected.astype(np.int32))
         max_diff_idx = np.unravel_index(np.argmax(diff), diff.shape)
         print(f"{layer_name} - 最大差异位置: {max_diff_idx}")
         print(f"{layer_name} - 计算值: {actual[max_diff_idx]:.6f}")
@@ -91,47 +115,232 @@ def assert_arrays_equal_with_details(actual, expected, layer_name):
 class TestConvLayers:
     """Test suite for convolutional layers with int8 quantization."""
     
-    def test_conv1_int8(self, layers, test_dir_name):
+    def test_conv1_int8(self, batched_conv_outputs, test_dir_name):
         """Test Conv1 layer with int8 quantization."""
         test_dir = DATA_DIR / test_dir_name
         
-        # Load input and expected output (returns SimData objects)
-        input_simdata = SimData.load_data_from_binary(
-            str(test_dir / "conv1.input.dat"), 1, 32, 32, q=7
-        )
+        # Load expected output
         expected_simdata = SimData.load_data_from_binary(
             str(test_dir / "conv1.output.dat"), 32, 32, 32, q=5
         )
         
-        # Forward pass (output_q=0, should result in requant_shift=0)
-        output_simdata = layers['conv1_int8'].forward(input_simdata, output_q=5)
+        # This case's slice of the batched forward pass (output_q=5)
+        i = TEST_DIRS.index(test_dir_name)
+        output_data = batched_conv_outputs['conv1'].data[i:i + 1]
         
         # Assert equality with detailed diagnostics
-        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv1 ({test_dir_name})")
+        assert_arrays_equal_with_details(output_data, expected_simdata.data, f"Conv1 ({test_dir_name})")
     
-    def test_conv2_int8(self, layers, test_dir_name):
+    def test_conv2_int8(self, batched_conv_outputs, test_dir_name):
         """Test Conv2 layer with int8 quantization."""
         test_dir = DATA_DIR / test_dir_name
         
-        # Load input and expected output
-        input_simdata = SimData.load_data_from_binary(
-            str(test_dir / "conv2.input.dat"), 32, 16, 16, q=5
-        )
+        # Load expected output
         expected_simdata = SimData.load_data_from_binary(
             str(test_dir / "conv2.output.dat"), 64, 16, 16, q=5
         )
         
-        # Forward pass (output_q=0, should result in requant_shift=0)
-        output_simdata = layers['conv2_int8'].forward(input_simdata, output_q=5)
+        # This case's slice of the batched forward pass (output_q=5)
+        i = TEST_DIRS.index(test_dir_name)
+        output_data = batched_conv_outputs['conv2'].data[i:i + 1]
         
         # Assert equality with detailed diagnostics
-        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv2 ({test_dir_name})")
+        assert_arrays_equal_with_details(output_data, expected_simdata.data, f"Conv2 ({test_dir_name})")
     
-    def test_conv3_int8(self, layers, test_dir_name):
+    def test_conv3_int8(self, batched_conv_outputs, test_dir_name):
         """Test Conv3 layer with int8 quantization."""
         test_dir = DATA_DIR / test_dir_name
         
-        # Load input and expected output
+        # Load expected output
+        expected_simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv3.output.dat"), 64, 8, 8, q=5
+        )
+        
+        # This case's slice of the batched forward pass (output_q=5)
+        i = TEST_DIRS.index(test_dir_name)
+        output_data = batched_conv_outputs['conv3'].data[i:i + 1]
+        
+        # Assert equality with detailed diagnostics
+        assert_arrays_equal_with_details(output_data, expected_simdata.data, f"Conv3 ({test_dir_name})")
+    
+    def test_conv4_int8(self, batched_conv_outputs, test_dir_name):
+        """Test Conv4 layer with int8 quantization."""
+        test_dir = DATA_DIR / test_dir_name
+        
+        # Load expected output
+        expected_simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv4.output.dat"), 128, 4, 4, q=5
+        )
+        
+        # This case's slice of the batched forward pass (output_q=5)
+        i = TEST_DIRS.index(test_dir_name)
+        output_data = batched_conv_outputs['conv4'].data[i:i + 1]
+        
+        # Assert equality with detailed diagnostics
+        assert_arrays_equal_with_details(output_data, expected_simdata.data, f"Conv4 ({test_dir_name})")
+    
+    def test_conv2_to_conv4_chain(self, layers, test_dir_name):
+        """Test chaining Conv2 -> ReLU -> Conv3 -> ReLU -> Conv4 with int8 data kept across layer boundaries."""
+        test_dir = DATA_DIR / test_dir_name
+        
+        simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv2.input.dat"), 32, 16, 16, q=5
+        )
+        expected_simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv4.output.dat"), 128, 4, 4, q=5
+        )
+        
+        for name in ('conv2_int8', 'conv3_int8'):
+            simdata = layers[name].forward(simdata, output_q=5)
+            assert simdata.data.dtype == np.int8
+            # ReLU on int8 stays int8, so the next layer consumes it without rounding
+            simdata = SimData(data=np.maximum(simdata.data, 0), q=simdata.q)
+        output_simdata = layers['conv4_int8'].forward(simdata, output_q=5)
+        
+        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv2-4 chain ({test_dir_name})")
+
+
+def test_quant_ext_matches_numpy():
+    """Test that the optional C quantize/dequantize extension is bit-exact with NumPy."""
+    if sim._quant_ext is None:
+        pytest.skip("_quant_ext.so not built")
+    
+    rng = np.random.default_rng(0)
+    data = (rng.standard_normal(4099) * 60).astype(np.float32)
+    quantized, scale = SimData.quantize_to_int8(data, 0.75)
+    expected = np.floor(np.clip(data * np.float32(0.75), -127, 127)).astype(np.int8)
+    assert np.array_equal(quantized, expected)
+    
+    dequantized = SimData.dequantize_from_int8(quantized, 128)
+    assert np.array_equal(dequantized, quantized.astype(np.float32) / 128)
+
+
+def test_vnni_ext_matches_numpy():
+    """Test that the optional VNNI int8 GEMM extension is exact, including K/N tails and int8 extremes."""
+    if sim._vnni_ext is None:
+        pytest.skip("_conv_vnni.so not built or CPU lacks AVX-512 VNNI")
+    
+    rng = np.random.default_rng(0)
+    for m, k, n in [(1, 1, 1), (5, 17, 33), (7, 3, 100), (257, 576, 128)]:
+        a = rng.integers(-128, 128, (m, k)).astype(np.int8)
+        b = rng.integers(-128, 128, (k, n)).astype(np.int8)
+        expected = a.astype(np.int64) @ b.astype(np.int64)
+        out = np.empty((m, n), dtype=np.int32)
+        sim._int8_matmul(a, b, out)
+        assert np.array_equal(out, expected)
+        # 预先打包的权重（各层缓存的形式）结果相同
+        out = np.empty((m, n), dtype=np.int32)
+        sim._int8_matmul(a, b, out, sim._pack_int8_weights(b))
+        assert np.array_equal(out, expected)
+
+
+def test_float_gemm_fallback_exact_at_int8_min(monkeypatch):
+    """Test that the float BLAS fallback stays exact when -128 pushes the sum past float32's mantissa."""
+    monkeypatch.setattr(sim, "_vnni_ext", None)
+    monkeypatch.setattr(sim, "_get_int_mm", lambda: None)
+
+    # K=1039: 1038 * 128 * 128 + 1 = 17006593 > 2^24，float32会舍入
+    a = np.array([[-128] * 1038 + [1]], dtype=np.int8)
+    b = np.array([[-128] * 1038 + [1]], dtype=np.int8).T.copy()
+    out = np.empty((1, 1), dtype=np.int32)
+    sim._int8_matmul(a, b, out)
+    assert out[0, 0] == 17006593
+
+
+def test_int8_data_matches_float_input(layers):
+    """Test that data loads as int8 and the legacy float32 input gives the same conv output."""
+    input_path = str(DATA_DIR / "im1" / "conv1.input.dat")
+    input_int8 = SimData.load_data_from_binary(input_path, 1, 32, 32, q=7)
+    input_float = SimData.load_data_from_binary(input_path, 1, 32, 32, q=7, dtype=np.float32)
+    assert input_int8.data.dtype == np.int8
+    assert input_float.data.dtype == np.float32
+    
+    output_int8 = layers['conv1_int8'].forward(input_int8, output_q=5)
+    output_float = layers['conv1_int8'].forward(input_float, output_q=5)
+    assert np.array_equal(output_int8.data, output_float.data)
+
+
+def test_conv_rejects_channel_mismatch(layers):
+    """Test that a conv input with the wrong channel count raises instead of reaching the GEMM."""
+    input_simdata = SimData(np.zeros((2, 3, 32, 32), dtype=np.int8), q=7)
+    with pytest.raises(ValueError):
+        layers['conv2_int8'].forward(input_simdata, output_q=5)
+
+    with pytest.raises(ValueError):
+        sim._int8_matmul(np.zeros((4, 3), dtype=np.int8), np.zeros((4, 2), dtype=np.int8),
+                         np.empty((4, 2), dtype=np.int32))
+
+
+def test_weights_gemm_int8_is_read_only(layers):
+    """Test that the exposed GEMM-layout weights cannot be written into the layer's cache."""
+    for name in ('conv2_int8', 'fc_int8'):
+        weights_mat = layers[name].weights_gemm_int8
+        assert not weights_mat.flags.writeable
+        assert weights_mat.flags.c_contiguous
+        with pytest.raises(ValueError):
+            weights_mat[0, 0] = 0
+    assert np.array_equal(layers['fc_int8'].weights_gemm_int8, layers['fc_int8'].weights_int8.T)
+
+
+def test_numba_conv_follows_current_geometry(monkeypatch):
+    """Test that the numba direct-conv fallback matches im2col-GEMM after stride/padding are changed."""
+    pytest.importorskip("numba")
+    input_simdata = SimData.load_data_from_binary(str(DATA_DIR / "im1" / "conv3.input.dat"), 64, 16, 16, q=5)
+    conv = ConvLayer(input_channels=64, output_channels=64, kernel_size=3, stride=1, padding=1)
+    conv.load_weights_from_binary(str(PARAM_DIR / "conv3.dat"), q=8)
+
+    for stride, padding in [(1, 1), (2, 1), (2, 0)]:
+        conv.stride, conv.padding = stride, padding
+        expected = conv.forward(input_simdata, output_q=5).data
+        with monkeypatch.context() as m:
+            # 缓冲区上限设为0，强制走numba直接卷积内核
+            m.setattr(sim, "_IM2COL_BUF_BYTES", 0)
+            actual = conv.forward(input_simdata, output_q=5).data
+        assert actual.shape == expected.shape
+        assert_arrays_equal_with_details(actual, expected, f"Conv numba stride={stride} padding={padding}")
+
+
+def test_fc_uses_int8_gemm(layers, monkeypatch):
+    """Test that FcLayer.forward goes through _int8_matmul with the cached packed weights."""
+    calls = []
+    int8_matmul = sim._int8_matmul
+
+    def recording_matmul(a, b, out, b_packed=None):
+        calls.append(b_packed)
+        return int8_matmul(a, b, out, b_packed)
+
+    monkeypatch.setattr(sim, "_int8_matmul", recording_matmul)
+    fc = layers['fc_int8']
+    fc.forward(SimData(np.ones((4, 128), dtype=np.int8), q=5), output_q=5)
+    assert len(calls) == 1
+    assert calls[0] is fc._weights_packed
+
+
+def test_binary_weights_are_snapshot(tmp_path):
+    """Test that rewriting or truncating a loaded weight file leaves the layer's weights unchanged."""
+    weight_path = tmp_path / "conv1.dat"
+    weight_path.write_bytes((PARAM_DIR / "conv1.dat").read_bytes())
+    conv = ConvLayer(input_channels=1, output_channels=32, kernel_size=5, stride=1, padding=2)
+    conv.load_weights_from_binary(str(weight_path), q=7)
+    expected = np.fromfile(PARAM_DIR / "conv1.dat", dtype=np.int8)
+
+    weight_path.write_bytes(bytes(len(expected)))
+    assert np.array_equal(conv.weights_int8.ravel(), expected)
+    weight_path.write_bytes(b"")
+    assert np.array_equal(conv.weights_int8.ravel(), expected)
+
+
+@pytest.mark.parametrize("test_dir_name", TEST_DIRS)
+class TestConvLayout:
+    """Test suite for the non-default NCHW im2col layout of ConvLayer."""
+    
+    def test_conv3_nchw(self, test_dir_name):
+        """Test Conv3 (stride 2, padding 1) computed with NCHW layout."""
+        test_dir = DATA_DIR / test_dir_name
+        
+        conv3_nchw = ConvLayer(input_channels=64, output_channels=64, kernel_size=3, stride=2, padding=1, data_layout='NCHW')
+        conv3_nchw.load_weights_from_binary(str(PARAM_DIR / "conv3.dat"), q=8)
+        
         input_simdata = SimData.load_data_from_binary(
             str(test_dir / "conv3.input.dat"), 64, 16, 16, q=5
         )
@@ -139,29 +348,77 @@ class TestConvLayers:
             str(test_dir / "conv3.output.dat"), 64, 8, 8, q=5
         )
         
-        # Forward pass (output_q=0, should result in requant_shift=0)
-        output_simdata = layers['conv3_int8'].forward(input_simdata, output_q=5)
+        output_simdata = conv3_nchw.forward(input_simdata, output_q=5)
         
-        # Assert equality with detailed diagnostics
-        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv3 ({test_dir_name})")
+        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv3 NCHW ({test_dir_name})")
     
-    def test_conv4_int8(self, layers, test_dir_name):
-        """Test Conv4 layer with int8 quantization."""
+    def test_unpadded_layouts_agree(self, test_dir_name):
+        """Test that the NHWC sliding-window im2col (padding 0) matches the NCHW region-split im2col."""
         test_dir = DATA_DIR / test_dir_name
         
-        # Load input and expected output
         input_simdata = SimData.load_data_from_binary(
-            str(test_dir / "conv4.input.dat"), 64, 8, 8, q=5
+            str(test_dir / "conv3.input.dat"), 64, 16, 16, q=5
+        )
+        outputs = []
+        for layout in ('NHWC', 'NCHW'):
+            conv = ConvLayer(input_channels=64, output_channels=64, kernel_size=3, stride=2, padding=0, data_layout=layout)
+            conv.load_weights_from_binary(str(PARAM_DIR / "conv3.dat"), q=8)
+            outputs.append(conv.forward(input_simdata, output_q=5).data)
+        
+        assert outputs[0].shape == (1, 64, 7, 7)
+        assert_arrays_equal_with_details(outputs[0], outputs[1], f"Conv3 padding=0 ({test_dir_name})")
+    
+    def test_pointwise_conv_as_fc(self, test_dir_name):
+        """Test the 1x1 conv fast path: a 1x1 conv with the FC weights reproduces the FC output."""
+        test_dir = DATA_DIR / test_dir_name
+        
+        conv_1x1 = ConvLayer(input_channels=128, output_channels=10, kernel_size=1)
+        conv_1x1.load_weights_from_binary(str(PARAM_DIR / "fc.dat"), q=6)
+        
+        input_simdata = SimData.load_data_from_binary(
+            str(test_dir / "fc.input.dat"), 128, 1, 1, q=5
         )
         expected_simdata = SimData.load_data_from_binary(
-            str(test_dir / "conv4.output.dat"), 128, 4, 4, q=5
+            str(test_dir / "fc.output.dat"), 10, 1, 1, q=5
         )
         
-        # Forward pass (output_q=0, should result in requant_shift=0)
-        output_simdata = layers['conv4_int8'].forward(input_simdata, output_q=5)
+        output_simdata = conv_1x1.forward(input_simdata, output_q=5)
         
-        # Assert equality with detailed diagnostics
-        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv4 ({test_dir_name})")
+        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv 1x1 ({test_dir_name})")
+
+
+@pytest.mark.parametrize("test_dir_name", TEST_DIRS)
+class TestTorchBackend:
+    """Test suite for the PyTorch device backend (run on CPU when no GPU is present)."""
+    
+    def test_conv2_fc_device(self, test_dir_name):
+        """Test Conv2 and FC layers computed with the PyTorch backend."""
+        torch = pytest.importorskip("torch")
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        test_dir = DATA_DIR / test_dir_name
+        
+        conv2_dev = ConvLayer(input_channels=32, output_channels=64, kernel_size=3, stride=1, padding=1, device=device)
+        conv2_dev.load_weights_from_binary(str(PARAM_DIR / "conv2.dat"), q=8)
+        fc_dev = FcLayer(input_size=128, output_size=10, device=device)
+        fc_dev.load_weights_from_binary(str(PARAM_DIR / "fc.dat"), q=6)
+        
+        input_simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv2.input.dat"), 32, 16, 16, q=5
+        )
+        expected_simdata = SimData.load_data_from_binary(
+            str(test_dir / "conv2.output.dat"), 64, 16, 16, q=5
+        )
+        output_simdata = conv2_dev.forward(input_simdata, output_q=5).to_numpy()
+        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data, f"Conv2 device ({test_dir_name})")
+        
+        input_simdata = SimData.load_data_from_binary(
+            str(test_dir / "fc.input.dat"), 128, 1, 1, q=5
+        )
+        expected_simdata = SimData.load_data_from_binary(
+            str(test_dir / "fc.output.dat"), 10, 1, 1, q=5
+        )
+        output_simdata = fc_dev.forward(input_simdata, output_q=5).to_numpy()
+        assert_arrays_equal_with_details(output_simdata.data, expected_simdata.data.reshape(1, -1), f"FC device ({test_dir_name})")
 
 
 @pytest.mark.parametrize("test_dir_name", TEST_DIRS)
@@ -187,6 +444,24 @@ class TestFcLayer:
         
         # Assert equality with detailed diagnostics
         assert_arrays_equal_with_details(output_simdata.data, expected_output, f"FC ({test_dir_name})")
+    
+    def test_fc_requant_rounding(self, test_dir_name):
+        """Test FC layer with round-to-nearest requantization."""
+        test_dir = DATA_DIR / test_dir_name
+        
+        fc_round = FcLayer(input_size=128, output_size=10, requant_rounding=True)
+        fc_round.load_weights_from_binary(str(PARAM_DIR / "fc.dat"), q=6)
+        
+        input_simdata = SimData.load_data_from_binary(
+            str(test_dir / "fc.input.dat"), 128, 1, 1, q=5
+        )
+        output_simdata = fc_round.forward(input_simdata, output_q=5)
+        
+        # Reference: (acc + 2^(shift-1)) >> shift, shift = 5 + 6 - 5
+        acc = input_simdata.data.reshape(1, -1).astype(np.int64) @ fc_round.weights_int8.astype(np.int64).T
+        expected_output = np.clip((acc + (1 << 5)) >> 6, -127, 127)
+        
+        assert_arrays_equal_with_details(output_simdata.data, expected_output, f"FC rounding ({test_dir_name})")
 
 
 if __name__ == "__main__":